@@ -2,6 +2,9 @@ import json
 import os
 import random
 
+# the train and test files written by write_speechacts
+SPEECHACT_FILES = ["data/speechacts_train.txt", "data/speechacts_test.txt"]
+
 
 def read_file(filename, form):
     """Reads a json file returns transcription data"""
@@ -83,9 +86,9 @@ def write_transcriptions():
 
 def return_speechacts():
     """Reads all speechacts and returns 2 arrays with train and test data"""
-    with open("data/speechacts_train.txt") as speech_file:
+    with open(SPEECHACT_FILES[0]) as speech_file:
         train_data = [s.replace("\n", "") for s in speech_file.readlines()]
-    with open("data/speechacts_test.txt") as speech_file:
+    with open(SPEECHACT_FILES[1]) as speech_file:
         test_data = [s.replace("\n", "") for s in speech_file.readlines()]
     return train_data, test_data
 
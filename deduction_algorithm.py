@@ -1,9 +1,15 @@
-import copy
-import string
+import argparse
+import heapq
+import itertools
 import json
-from utils import norm_input, closest_word, c, all_inputs
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import sys
+import time
+from utils import norm_input, c, all_inputs, BKTree, LRUCache, file_hash
 from Levenshtein import ratio
-from itertools import combinations
 
 
 def get_word_data():
@@ -16,36 +22,76 @@ def get_word_data():
     return x
 
 
+class Lexicon:
+    """
+    The 'inform' vocabulary, loaded once
+    Exact words are found in a dict, misspelled words in a BK-tree
+    """
+
+    def __init__(self, word_data=None, cache_size=4096):
+        if word_data is None:
+            word_data = get_word_data()
+        self.words = {}
+        self.order = {}
+        for word in word_data:
+            if word[0] not in self.words:
+                self.order[word[0]] = len(self.order)
+                self.words[word[0]] = "|".join(word[1:])
+        self.tree = BKTree(self.words)
+        # (misspelled word, threshold) -> types, bounded as the words
+        # come from the users
+        self.cache = LRUCache(cache_size)
+
+    def types(self, user_word, threshold=0.8):
+        """
+        Returns the types of a word, or of the closest word when
+        the ratio is above threshold, else "none"
+        """
+        if user_word in self.words:
+            return self.words[user_word]
+        types = self.cache.get((user_word, threshold))
+        if types is None:
+            best_word = self.closest(user_word, threshold)
+            types = self.words[best_word] if best_word else "none"
+            self.cache.put((user_word, threshold), types)
+        return types
+
+    def closest(self, user_word, threshold=0.8):
+        """Returns the vocabulary word with the best ratio above threshold"""
+        if threshold <= 0:
+            candidates = self.words
+        else:
+            # a ratio above threshold bounds the distance by the length
+            radius = 2 * len(user_word) * (1 - threshold) / threshold
+            candidates = [word for _, word in
+                          self.tree.search(user_word, radius)]
+        best_match = threshold
+        best_word = ""
+        for word in sorted(candidates, key=lambda w: self.order[w]):
+            match = ratio(word, user_word)
+            if match > best_match:
+                best_match = match
+                best_word = word
+        return best_word
+
+
+_lexicon = None
+
+
+def get_lexicon():
+    """Returns the lexicon, loads it on the first call"""
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = Lexicon()
+    return _lexicon
+
+
 def map_word_to_type(test_input, threshold=0.8):
     """maps all data of an input sentence to their types"""
-    user_input = test_input.lower()
-    for punct in string.punctuation:
-        user_input = user_input.replace(punct, "")
-    word_index = get_word_data()
-    words = []
-    types = []
-    for user_word in user_input.split(" "):
-        wordfound = False
-        for word in word_index:
-            best_match = 100
-            best_word = ()
-            if word[0] == user_word:
-                wordfound = True
-                words.append(user_word)
-                types.append("|".join(word[1:]))
-            else:
-                match = ratio(word[0], user_word)
-                if match < best_match:
-                    best_match = match
-                    best_word = word
-        if not wordfound:
-            if best_match > threshold:
-                words.append(user_word)
-                types.append(best_word[1])
-            else:
-                words.append(user_word)
-                types.append("none")
-    return list(zip(words, types))
+    lexicon = get_lexicon()
+    user_input = norm_input(test_input)
+    return [(user_word, lexicon.types(user_word, threshold))
+            for user_word in user_input.split(" ")]
 
 
 def variable_val_keys():
@@ -56,10 +102,137 @@ def variable_val_keys():
     return var_val["informable"], var_keys
 
 
-def deduct_sentence(sentence):
-    """Helper function to deduct"""
+class SlotMatcher:
+    """
+    The variable keywords and values compiled for one pass over a sentence
+    Values are found as whole phrases, longest first, values that do not
+    occur literally are looked up per remaining word in a BK-tree
+    """
+
+    def __init__(self, var_val=None, var_keys=None):
+        if var_val is None or var_keys is None:
+            var_val, var_keys = variable_val_keys()
+        # keyword -> [(variable index, keyword index, variable, keyword)]
+        self.keywords = {}
+        # phrase -> [(variable, value index, value)]
+        self.phrases = {}
+        # first word -> phrases starting with it, longest first
+        self.first_words = {}
+        # value -> [(variable, value index)]
+        self.values = {}
+        for var_index, (variable, keys) in enumerate(var_keys.items()):
+            for key_index, key in enumerate(keys):
+                self.keywords.setdefault(key, []).append(
+                    (var_index, key_index, variable, key))
+            for index, value in enumerate(var_val[variable]):
+                phrase = tuple(value.split(" "))
+                self.phrases.setdefault(phrase, []).append(
+                    (variable, index, value))
+                self.first_words.setdefault(phrase[0], set()).add(phrase)
+                self.values.setdefault(value, []).append((variable, index))
+        for word, phrases in self.first_words.items():
+            self.first_words[word] = sorted(phrases, key=len, reverse=True)
+        self.tree = BKTree(self.values)
+
+    def match(self, sentence, threshold=0.8):
+        """
+        Finds the keywords and values in a list of words
+        Returns the (variable, keyword) pairs in the order of the keyword
+        file, the positions of every keyword and per variable a list of
+        (value, matched words, [(start, end)]) in the order of the value file
+        """
+        found = []
+        positions = {}
+        for i, word in enumerate(sentence):
+            if word in self.keywords:
+                if word not in positions:
+                    found += self.keywords[word]
+                positions.setdefault(word, []).append(i)
+        to_derive = [(variable, key) for _, _, variable, key in sorted(found)]
+        variables = set(variable for variable, _ in to_derive)
+
+        # (variable, value) -> (value index, ratio, matched words, spans)
+        hits = {}
+        missed = []
+        i = 0
+        while i < len(sentence):
+            length = 1
+            for phrase in self.first_words.get(sentence[i], []):
+                if tuple(sentence[i:i + len(phrase)]) != phrase:
+                    continue
+                slots = [slot for slot in self.phrases[phrase]
+                         if slot[0] in variables]
+                if slots:
+                    length = len(phrase)
+                    for variable, index, value in slots:
+                        hit = hits.setdefault((variable, value),
+                                              (index, 2, value, []))
+                        hit[3].append((i, i + length))
+                    break
+            else:
+                missed.append(i)
+            i += length
+
+        # fuzzy fallback for the words without a literal value
+        for i in missed:
+            word = sentence[i]
+            radius = 2 * len(word) * (1 - threshold) / threshold
+            for _, value in self.tree.search(word, radius):
+                match = ratio(value, word)
+                if match <= threshold:
+                    continue
+                for variable, index in self.values[value]:
+                    if variable not in variables:
+                        continue
+                    hit = hits.get((variable, value))
+                    if not hit or match > hit[1]:
+                        hits[(variable, value)] = (index, match, word,
+                                                   [(i, i + 1)])
+                    elif match == hit[1] and word == hit[2]:
+                        hit[3].append((i, i + 1))
+
+        matches = {}
+        for (variable, value), (index, _, words, spans) in hits.items():
+            matches.setdefault(variable, []).append((index, value, words,
+                                                     spans))
+        for variable, found_values in matches.items():
+            matches[variable] = [(value, words, spans) for
+                                 _, value, words, spans in
+                                 sorted(found_values)]
+        return to_derive, positions, matches
+
+
+_slot_matcher = None
+
+
+def get_slot_matcher():
+    """Returns the slot matcher, compiles it on the first call"""
+    global _slot_matcher
+    if _slot_matcher is None:
+        _slot_matcher = SlotMatcher()
+    return _slot_matcher
+
+
+# number of derivation steps explored by deduct, beam_deduct
+# and chart_deduct since the last reset
+stats = {"derivations": 0}
+
+
+def deduct_sentence(sentence, method="chart", **budget):
+    """
+    Helper function to deduct
+    param method: "chart" for the dynamic programming parser,
+                  "beam" for the budgeted search of beam_deduct,
+                  "exhaustive" to enumerate every derivation with deduct
+    param budget: beam_width, max_nodes and max_time for beam_deduct
+    """
     s_data = map_word_to_type(sentence)
-    all_trees = deduct((s_data, (None, None, None)), tree=[])
+    if method == "chart":
+        all_trees = [chart_deduct(s_data)]
+    elif method == "beam":
+        all_trees = list(beam_deduct(s_data, **budget))
+    else:
+        all_trees = deduct((s_data, (None, None, None)))
     trees, best_tree = tree_filter(all_trees)
     # TODO: better tree selection
     return best_tree
@@ -101,16 +274,53 @@ def score_tree(treep):
     return score
 
 
-def deduct(wordp, tree=[]):
+class Derivation:
+    """
+    A step of a derivation with a pointer to the step before it,
+    so branches share the steps they have in common
+    Behaves like the list of steps from the first one up to this one
+    """
+    __slots__ = ("wordp", "parent", "depth")
+
+    def __init__(self, wordp, parent=None):
+        self.wordp = wordp
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 1
+
+    def __len__(self):
+        return self.depth
+
+    def __iter__(self):
+        steps = []
+        node = self
+        while node:
+            steps.append(node.wordp)
+            node = node.parent
+        return reversed(steps)
+
+    def __getitem__(self, index):
+        if index == -1 or index == self.depth - 1:
+            return self.wordp
+        return list(self)[index]
+
+
+def deduct(wordp, tree=None, states=None):
     """
     Recursively combine the words according to the corresponding rules
+    Returns the last step of every derivation
     """
+    if states is None:
+        states = {}
+    stats["derivations"] += 1
     words, rapp = wordp
+    # the same words reached in another order share one tuple
+    words = states.setdefault(tuple(words), tuple(words))
+    wordp = (words, rapp)
     derivables = []
     for index, word in enumerate(words):
         if deductable(words, index):
             derivables.append((word, index))
-    tree.append(wordp)
+    tree = Derivation(wordp, tree)
     if not derivables:
         return [tree]
     else:
@@ -119,72 +329,289 @@ def deduct(wordp, tree=[]):
             wordpair, index = derivable
             word, types = wordpair
             for typ in types.split("|"):
-                sen = copy.copy(words)
-                sen[index] = (word, typ)
+                sen = words[:index] + ((word, typ),) + words[index + 1:]
                 subsentence = combine(sen, index)
-                subtree = deduct(subsentence, tree=copy.copy(tree))
-                subtrees += subtree
+                subtrees += deduct(subsentence, tree=tree, states=states)
         return subtrees
 
 
+def derivations(wordp):
+    """
+    Lazily yields every sub sentence deduct would recurse on
+    """
+    words, rapp = wordp
+    for index, wordpair in enumerate(words):
+        if deductable(words, index):
+            word, types = wordpair
+            for typ in types.split("|"):
+                sen = words[:index] + ((word, typ),) + words[index + 1:]
+                yield combine(sen, index)
+
+
+def beam_deduct(s_data, beam_width=100, max_nodes=None, max_time=None):
+    """
+    Best-first search over the derivations of deduct,
+    the partial tree with the least words and lowest score goes first
+    Yields every finished tree that beats the ones before it
+    When max_nodes or max_time (seconds) runs out,
+    the best tree found so far is yielded last
+    """
+    start = time.time()
+    first = Derivation((tuple(s_data), (None, None, None)))
+    # the counter keeps the heap from comparing trees
+    counter = itertools.count()
+    frontier = [(len(s_data), 0, next(counter), first)]
+    seen = {}
+    best = None
+    best_partial = None
+    nodes = 0
+    while frontier:
+        if (max_nodes is not None and nodes >= max_nodes) or \
+           (max_time is not None and time.time() - start >= max_time):
+            if best_partial and (not best or best_partial[0] < best[0]):
+                yield best_partial[1]
+            return
+        length, score, _, tree = heapq.heappop(frontier)
+        # nothing left can beat a finished single constituent
+        if best and best[0][0] == 1 and score >= best[0][1]:
+            continue
+        nodes += 1
+        stats["derivations"] += 1
+        if not best_partial or (length, score) < best_partial[0]:
+            best_partial = ((length, score), tree)
+        finished = True
+        for subsentence in derivations(tree[-1]):
+            finished = False
+            words, rapp = subsentence
+            l, d, r = rapp
+            sub_score = score
+            if d:
+                sub_score += len(l[0].split(" ")) + len(l[0].split(" "))
+            if words in seen and seen[words] <= sub_score:
+                continue
+            seen[words] = sub_score
+            heapq.heappush(frontier, (len(words), sub_score, next(counter),
+                                      Derivation(subsentence, tree)))
+        if finished and (not best or (length, score) < best[0]):
+            best = ((length, score), tree)
+            yield tree
+        if beam_width is not None and len(frontier) > beam_width:
+            frontier = heapq.nsmallest(beam_width, frontier)
+
+
+def chart_deduct(s_data):
+    """
+    CKY style parser, fills every span of the sentence once
+    Returns the best tree in the same format as the trees of deduct
+    """
+    grammar = get_grammar()
+    n = len(s_data)
+    # chart[i][j] maps a type id of span i..j to (score, backpointer)
+    chart = [[{} for _ in range(n + 1)] for _ in range(n + 1)]
+    for i, (word, types) in enumerate(s_data):
+        for typ in grammar.type_ids(types):
+            if typ not in chart[i][i + 1]:
+                chart[i][i + 1][typ] = (0, None)
+    for length in range(2, n + 1):
+        for i in range(n - length + 1):
+            j = i + length
+            cell = chart[i][j]
+            for k in range(i + 1, j):
+                # same cost as score_tree gives to the combination
+                cost = 2 * (k - i)
+                for l_type, (l_score, _) in chart[i][k].items():
+                    for r_type, (r_score, _) in chart[k][j].items():
+                        results = grammar.table.get((l_type, r_type), ())
+                        for typ, direction in results:
+                            stats["derivations"] += 1
+                            score = l_score + r_score + cost
+                            if typ not in cell or score < cell[typ][0]:
+                                cell[typ] = (score, (k, l_type, direction,
+                                                     r_type))
+    return chart_tree(s_data, chart, chart_cover(chart, n), grammar)
+
+
+def chart_cover(chart, n):
+    """
+    Splits the sentence in the least number of spans,
+    ties are broken by the lowest score
+    Returns a list of (start, end, type)
+    """
+    best = [None] * (n + 1)
+    best[0] = ((0, 0), None)
+    for j in range(1, n + 1):
+        for i in range(j):
+            for typ, (score, _) in chart[i][j].items():
+                count, total = best[i][0]
+                cost = (count + 1, total + score)
+                if best[j] is None or cost < best[j][0]:
+                    best[j] = (cost, (i, typ))
+    cover = []
+    j = n
+    while j > 0:
+        i, typ = best[j][1]
+        cover.append((i, j, typ))
+        j = i
+    return cover[::-1]
+
+
+def chart_tree(s_data, chart, cover, grammar):
+    """
+    Follows the backpointers of the chart and replays the combinations,
+    smallest spans first, as the steps of a tree
+    """
+    steps = []
+    todo = list(cover)
+    while todo:
+        i, j, typ = todo.pop()
+        score, backpointer = chart[i][j][typ]
+        if backpointer:
+            k, l_type, direction, r_type = backpointer
+            steps.append((i, k, j, typ, l_type, direction, r_type))
+            todo.append((i, k, l_type))
+            todo.append((k, j, r_type))
+    steps.sort(key=lambda step: (step[2] - step[0], step[0]))
+
+    # every entry holds the start and end of its span in the sentence
+    spans = [(i, i + 1, word, types)
+             for i, (word, types) in enumerate(s_data)]
+    tree = [(list(s_data), (None, None, None))]
+    for i, k, j, typ, l_type, direction, r_type in steps:
+        index = [span[0] for span in spans].index(i)
+        l_word = spans[index][2]
+        r_word = spans[index + 1][2]
+        spans[index:index + 2] = [(i, j, l_word + " " + r_word,
+                                   grammar.types[typ])]
+        rapp = ((l_word, grammar.types[l_type]),
+                direction,
+                (r_word, grammar.types[r_type]))
+        tree.append(([(word, types) for _, _, word, types in spans], rapp))
+    return tree
+
+
 def deductable(words, i):
+    grammar = get_grammar()
     word, word_type = words[i]
-    rules = parse_rules(words[i][1])
-    for rule in rules:
+    for rule in grammar.rules_of(word_type):
         left, direction, right = rule
         if direction == "L" and i > 0:
             l_word, l_word_type = words[i - 1]
-            for l_type in l_word_type.split("|"):
-                if left == l_type:
-                    return True
+            if left in grammar.type_ids(l_word_type):
+                return True
         elif direction == "R" and i < len(words)-1:
             r_word, r_word_type = words[i + 1]
-            for r_type in r_word_type.split("|"):
-                if right == r_type:
-                    return True
+            if right in grammar.type_ids(r_word_type):
+                return True
     return False
 
 
-def combine(orgwords, i):
+def combine(words, i):
     """
     Performs the application of the deduction rule
+    Returns the combined words as a new tuple
     """
-    words = copy.copy(orgwords)
+    grammar = get_grammar()
+    words = tuple(words)
     word, word_type = words[i]
-    rules = parse_rules(words[i][1])
-    for rule in rules:
+    for rule in grammar.rules_of(word_type):
         left, direction, right = rule
         if direction == "L" and i > 0:
             l_word, l_word_type = words[i - 1]
-            for l_type in l_word_type.split("|"):
-                if left == l_type:
-                    comb_word = l_word + " " + word
-                    del words[i]
-                    words[i-1] = (comb_word, right)
-                    rapp = ((l_word, l_word_type),
-                            direction,
-                            (word, word_type))
-                    return words, rapp
+            if left in grammar.type_ids(l_word_type):
+                comb_word = l_word + " " + word
+                words = words[:i - 1] + \
+                    ((comb_word, grammar.types[right]),) + words[i + 1:]
+                rapp = ((l_word, l_word_type),
+                        direction,
+                        (word, word_type))
+                return words, rapp
         elif direction == "R" and i < len(words)-1:
             r_word, r_word_type = words[i + 1]
-            for r_type in r_word_type.split("|"):
-                if right == r_type:
-                    comb_word = word + " " + r_word
-                    del words[i]
-                    words[i] = (comb_word, left)
-                    rapp = ((word, word_type),
-                            direction,
-                            (r_word, r_word_type))
-                    return words, rapp
+            if right in grammar.type_ids(r_word_type):
+                comb_word = word + " " + r_word
+                words = words[:i] + \
+                    ((comb_word, grammar.types[left]),) + words[i + 2:]
+                rapp = ((word, word_type),
+                        direction,
+                        (r_word, r_word_type))
+                return words, rapp
     return words, (None, None, None)
 
 
-def parse_rules(rule):
-    """Helper function for parse_rule"""
-    rules = []
-    for r in rule.split("|"):
-        rules.append(parse_rule(r))
-    return rules
+class Grammar:
+    """
+    The categorial grammar of the vocabulary, compiled once
+    Every type is interned to an integer id, rules and the results of
+    all applications are stored by id
+    """
+
+    def __init__(self, word_data=None):
+        if word_data is None:
+            word_data = get_word_data()
+        # id -> type string and type string -> id
+        self.types = []
+        self.ids = {}
+        # id -> (left id, direction, right id) of the parsed rule
+        self.rules = []
+        # (left id, right id) -> ((result id, direction), ...)
+        self.table = {}
+        # "|" separated types -> ids and rules of the alternatives
+        self.alternatives = {}
+        self.alternative_rules = {}
+        for word in word_data:
+            self.type_ids("|".join(word[1:]))
+
+    def intern(self, typ):
+        """Returns the id of a type, compiles its rule when it is new"""
+        if typ in self.ids:
+            return self.ids[typ]
+        typ_id = len(self.types)
+        self.ids[typ] = typ_id
+        self.types.append(typ)
+        self.rules.append((None, "", None))
+        left, direction, right = parse_rule(typ)
+        if direction:
+            left_id = self.intern(left)
+            right_id = self.intern(right)
+            self.rules[typ_id] = (left_id, direction, right_id)
+            if direction == "L":
+                # left_id on the left of typ gives right_id
+                self.add_application(left_id, typ_id, right_id, direction)
+            else:
+                # right_id on the right of typ gives left_id
+                self.add_application(typ_id, right_id, left_id, direction)
+        return typ_id
+
+    def add_application(self, l_type, r_type, result, direction):
+        results = self.table.get((l_type, r_type), ())
+        results += ((result, direction),)
+        self.table[(l_type, r_type)] = tuple(sorted(results,
+                                                    key=lambda r: r[1]))
+
+    def type_ids(self, types):
+        """Ids of the alternatives in a "|" separated string of types"""
+        if types not in self.alternatives:
+            self.alternatives[types] = tuple(self.intern(typ)
+                                             for typ in types.split("|"))
+        return self.alternatives[types]
+
+    def rules_of(self, types):
+        """Compiled rules of the alternatives in a string of types"""
+        if types not in self.alternative_rules:
+            self.alternative_rules[types] = tuple(
+                self.rules[typ] for typ in self.type_ids(types))
+        return self.alternative_rules[types]
+
+
+_grammar = None
+
+
+def get_grammar():
+    """Returns the grammar, compiles it on the first call"""
+    global _grammar
+    if _grammar is None:
+        _grammar = Grammar()
+    return _grammar
 
 
 def parse_rule(rule):
@@ -226,51 +653,199 @@ def remove_outer_par(string):
     return string
 
 
+# the data deduct_preferences depends on
+DATA_FILES = ["data/inform_vocabulary_edited.txt",
+              "data/variable_keywords.json",
+              "data/variable_values.json"]
+
+
+def data_hash(files=DATA_FILES):
+    """Hash of the contents of the data files"""
+    return file_hash(files)
+
+
+def reset_data():
+    """Forget the loaded grammar, lexicon and slot matcher"""
+    global _grammar, _lexicon, _slot_matcher
+    _grammar = None
+    _lexicon = None
+    _slot_matcher = None
+
+
+class PreferenceCache:
+    """
+    Results of deduct_preferences by normalised sentence and threshold
+    An LRU cache in memory, optionally backed by a sqlite file
+    that keeps the results for restarted processes
+    All results are dropped when one of the DATA_FILES changes
+    """
+
+    def __init__(self, size=1024, path=None):
+        self.memory = LRUCache(size)
+        self.path = path
+        self.disk_hits = 0
+        self.stamp = None
+        self.version = None
+        self.db = None
+        self.pid = None
+
+    def check(self):
+        """Hash the data files again when they were touched"""
+        stamp = []
+        for filename in DATA_FILES:
+            stat = os.stat(filename)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        if stamp == self.stamp:
+            return
+        self.stamp = stamp
+        version = data_hash()
+        if version != self.version:
+            if self.version is not None:
+                reset_data()
+            self.version = version
+            self.memory.clear()
+            if self.connect():
+                self.db.execute("DELETE FROM preferences WHERE version != ?",
+                                (version,))
+                self.db.commit()
+
+    def connect(self):
+        """Opens the sqlite file, again in a forked process"""
+        if not self.path:
+            return None
+        if self.db is None or self.pid != os.getpid():
+            self.db = sqlite3.connect(self.path)
+            self.pid = os.getpid()
+            columns = [row[1] for row in
+                       self.db.execute("PRAGMA table_info(preferences)")]
+            if columns and "threshold" not in columns:
+                # a cache file from before the threshold was in the key
+                self.db.execute("DROP TABLE preferences")
+            self.db.execute("CREATE TABLE IF NOT EXISTS preferences "
+                            "(version TEXT, sentence TEXT, threshold REAL, "
+                            "result BLOB, "
+                            "PRIMARY KEY (version, sentence, threshold))")
+        return self.db
+
+    def get(self, sentence, threshold=0.8):
+        self.check()
+        result = self.memory.get((sentence, threshold))
+        if result is None and self.connect():
+            row = self.db.execute("SELECT result FROM preferences "
+                                  "WHERE version = ? AND sentence = ? "
+                                  "AND threshold = ?",
+                                  (self.version, sentence,
+                                   threshold)).fetchone()
+            if row:
+                self.disk_hits += 1
+                result = pickle.loads(row[0])
+                self.memory.put((sentence, threshold), result)
+        return result
+
+    def put(self, sentence, result, threshold=0.8):
+        self.memory.put((sentence, threshold), result)
+        if self.connect():
+            self.db.execute("INSERT OR REPLACE INTO preferences "
+                            "VALUES (?, ?, ?, ?)",
+                            (self.version, sentence, threshold,
+                             pickle.dumps(result)))
+            self.db.commit()
+
+    def clear(self):
+        self.memory.clear()
+        if self.connect():
+            self.db.execute("DELETE FROM preferences")
+            self.db.commit()
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+
+preference_cache = PreferenceCache()
+
+
+def set_preference_cache(size=1024, path=None):
+    """Replace the cache of deduct_preferences, size 0 disables it"""
+    global preference_cache
+    preference_cache = PreferenceCache(size, path) if size else None
+
+
 def deduct_preferences(sentence, threshold=0.8):
+    """
+    Extract preferences from sentence using variable values and keys
+    Results are kept in preference_cache
+    """
+    if preference_cache is None:
+        return find_preferences(sentence, threshold)
+    key = norm_input(sentence)
+    result = preference_cache.get(key, threshold)
+    if result is None:
+        result = find_preferences(sentence, threshold)
+        preference_cache.put(key, result, threshold)
+    preferences, sentence_tree_rapp = result
+    return list(preferences), sentence_tree_rapp
+
+
+def find_preferences(sentence, threshold=0.8):
     """
     Extract preferences from sentence using variable values and keys
     """
-    var_val, var_keys = variable_val_keys()
+    matcher = get_slot_matcher()
     sentence_tree_rapp = deduct_sentence(sentence)
     sentence_tree = tree_lose_rapp(sentence_tree_rapp)
     sentence = norm_input(sentence).split(" ")
 
-    # Find the keywords that indicate a preference
-    to_derive = []
-    for variable, keys in var_keys.items():
-        for key in keys:
-            if key in sentence:
-                to_derive.append((variable, key))
+    # Find the keywords that indicate a preference and the values
+    to_derive, positions, matches = matcher.match(sentence, threshold)
 
     # Find the matching values for the preferences in the lowest subtree
+    span_tree = tree_spans(sentence_tree)
     preferences = []
-    for der in to_derive:
-        var, key = der
-        values = var_val[der[0]]
-        for value in values:
-            best_match = closest_word(value, sentence)
-            if best_match:
-                subtree = get_preference(sentence_tree, var, best_match, key)
-                if subtree[0]:
-                    preferences.append((var, value, key, subtree))
+    for var, key in to_derive:
+        for value, best_match, spans in matches.get(var, []):
+            subtree, subspan = get_preference(span_tree, spans,
+                                              positions[key])
+            if subtree[0]:
+                preferences.append((var, value, key, subtree, subspan))
 
     # Remove overlapping trees
     preferences = disjoint_preferences(preferences)
-    preferences = order_preferences(preferences, sentence)
+    preferences = order_preferences(preferences)
     return preferences, sentence_tree_rapp
 
 
-def get_preference(tree, variable, value, key):
+def tree_spans(tree):
     """
-    Iterate through the trees, return the first subtree
+    Adds to every subtree of every step the (start, end)
+    word positions it covers in the sentence
+    """
+    span_tree = []
+    for step in tree:
+        start = 0
+        spans = []
+        for sub_sent in step:
+            end = start + len(sub_sent[0].split(" "))
+            spans.append(((start, end), sub_sent))
+            start = end
+        span_tree.append(spans)
+    return span_tree
+
+
+def get_preference(span_tree, value_spans, key_positions):
+    """
+    Iterate through the trees, return the first subtree and its span
     where the keyword and the value occur together
     """
-    for subtree in tree:
-        for sub_sent in subtree:
-            words, words_type = sub_sent
-            if (value in words) and (key in words):
-                return sub_sent
-    return (None, None)
+    for step in span_tree:
+        for span, sub_sent in step:
+            start, end = span
+            if any(start <= key < end for key in key_positions) and \
+               any(start <= v_start and v_end <= end
+                   for v_start, v_end in value_spans):
+                return sub_sent, span
+    return (None, None), None
 
 
 def disjoint_preferences(preferences):
@@ -279,43 +854,36 @@ def disjoint_preferences(preferences):
     When two subtrees are equal with different preference/values, dismiss both
     When one subtree encapsulates another, dismiss the first
     """
-    exclude = []
-    for pref1, pref2 in combinations(preferences, 2):
-        var1, val1, key1, tree1 = pref1
-        var2, val2, key2, tree2 = pref2
-        if (tree1[0] == tree2[0]):
-            if (var1, val1) == (var2, val2):
-                exclude.append(pref1)
-            else:
-                exclude.append(pref1)
-                exclude.append(pref2)
-        elif (tree1[0] in tree2[0]):
-            exclude.append(pref2)
-        elif (tree2[0] in tree1[0]):
-            exclude.append(pref1)
-    return list(set(preferences)-set(exclude))
-
-
-def order_preferences(preferences, sentence):
-    ordered_preferences = []
-    ordered_sentence = ""
-    for word in sentence:
-        ordered_sentence += " {}".format(word)
-        for preference in preferences:
-            var, val, key, subtree = preference
-            if subtree[0] in ordered_sentence and \
-               preference not in ordered_preferences:
-                ordered_preferences.append(preference)
-    return ordered_preferences
+    by_span = {}
+    for preference in preferences:
+        by_span.setdefault(preference[4], []).append(preference)
+    # sorted by end, the longest first, every span that starts at or
+    # after the start of a later span is encapsulated by it
+    spans = sorted(by_span, key=lambda span: (span[1], -span[0]))
+    disjoint = []
+    last_start = -1
+    for span in spans:
+        encapsulates = last_start >= span[0]
+        last_start = max(last_start, span[0])
+        equal = by_span[span]
+        if encapsulates or len(set((p[0], p[1]) for p in equal)) > 1:
+            continue
+        disjoint.append(equal[-1])
+    return disjoint
+
+
+def order_preferences(preferences):
+    """Order the preferences by where their subtree ends in the sentence"""
+    return sorted(preferences, key=lambda preference: preference[4][::-1])
 
 
 def print_preferences(preferences):
     for preference in preferences:
-        var, val, key, tree = preference
+        var, val, key, tree, span = preference
         print("{} {} {}: {}".format(c.B, var.rjust(10), c.E, val))
     for preference in preferences:
         print(" ")
-        var, val, key, tree = preference
+        var, val, key, tree, span = preference
         print(" Variable: {}".format(var))
         print("    Value: {}".format(val))
         print("  Keyword: {}".format(key))
@@ -347,6 +915,82 @@ def print_all(sentence, tree, preferences):
     print(" ")
 
 
+def init_worker():
+    """Load the grammar, lexicon and slot matcher once per process"""
+    get_grammar()
+    get_lexicon()
+    get_slot_matcher()
+
+
+def batch_preferences(sentences, processes=None, chunksize=64,
+                      batch_size=4096):
+    """
+    Extract the preferences of many sentences with a pool of processes
+    Every normalised sentence is only deducted once
+    Yields (sentence, preferences, tree) in the order of sentences
+    param processes: number of worker processes, None for all cores,
+                     1 to work in this process
+    """
+    init_worker()
+    pool = None
+    if processes != 1:
+        pool = multiprocessing.Pool(processes, initializer=init_worker)
+    results = {}
+    try:
+        sentences = iter(sentences)
+        while True:
+            batch = list(itertools.islice(sentences, batch_size))
+            if not batch:
+                break
+            keys = [norm_input(sentence) for sentence in batch]
+            todo = list(set(key for key in keys if key not in results))
+            if pool:
+                found = pool.map(find_preferences, todo, chunksize)
+            else:
+                found = [find_preferences(key) for key in todo]
+            results.update(zip(todo, found))
+            for sentence, key in zip(batch, keys):
+                preferences, tree = results[key]
+                yield sentence, list(preferences), tree
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def read_sentences(filename):
+    """
+    Read one sentence per line,
+    from a dialog file only the user turns are read
+    """
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("system:") or not line:
+                continue
+            if line.startswith("user:"):
+                line = line[len("user:"):].strip()
+            yield line
+
+
+def batch_main(filename, output=None, processes=None):
+    """Write the preferences of every sentence in a file as json lines"""
+    out = open(output, "w") if output else sys.stdout
+    try:
+        for sentence, preferences, tree in batch_preferences(
+                read_sentences(filename), processes=processes):
+            prefs = [{"variable": var,
+                      "value": val,
+                      "keyword": key,
+                      "subtree": subtree[0],
+                      "span": span}
+                     for var, val, key, subtree, span in preferences]
+            out.write(json.dumps({"sentence": sentence,
+                                  "preferences": prefs}) + "\n")
+    finally:
+        if output:
+            out.close()
+
+
 def test():
     for i, test in enumerate(all_inputs):
         sen = "{}: {}".format(str(i+1).rjust(2), test)
@@ -355,15 +999,26 @@ def test():
 
 
 if __name__ == "__main__":
-    while True:
-        print(c.B + "Please enter a sentence" + c.E)
-        print(c.r + "[t]" + c.E + "to test all assignment sentences")
-        print(c.r + "[q]" + c.E + "to quit")
-        user_input = input()
-        if user_input == "q":
-            break
-        elif user_input == "t":
-            test()
-        else:
-            pref, sent = deduct_preferences(user_input)
-            print_all(user_input, sent, pref)
+    parser = argparse.ArgumentParser(
+        description="Extract preferences, interactively without input")
+    parser.add_argument("input", nargs="?",
+                        help="file with a sentence per line or a dialog file")
+    parser.add_argument("-o", "--output", help="json lines file to write")
+    parser.add_argument("-p", "--processes", type=int,
+                        help="number of processes, all cores by default")
+    args = parser.parse_args()
+    if args.input:
+        batch_main(args.input, args.output, args.processes)
+    else:
+        while True:
+            print(c.B + "Please enter a sentence" + c.E)
+            print(c.r + "[t]" + c.E + "to test all assignment sentences")
+            print(c.r + "[q]" + c.E + "to quit")
+            user_input = input()
+            if user_input == "q":
+                break
+            elif user_input == "t":
+                test()
+            else:
+                pref, sent = deduct_preferences(user_input)
+                print_all(user_input, sent, pref)
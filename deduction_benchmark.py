@@ -0,0 +1,157 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from deduction_algorithm import deduct_sentence, read_sentences, stats
+from utils import all_inputs, percentile
+
+
+# words the synthetic sentences are cut from
+SYNTHETIC = ("i am looking for a moderately priced restaurant in the west "
+             "part of town that serves world food and an expensive "
+             "restaurant in the east part of town with cheap chinese food "
+             "or a cheap restaurant in the south that serves tuscan food")
+
+
+def synthetic_sentences(max_length=40, step=2):
+    """Sentences of increasing length, cut from SYNTHETIC"""
+    words = SYNTHETIC.split(" ")
+    while len(words) < max_length:
+        words += ["and"] + SYNTHETIC.split(" ")
+    return [" ".join(words[:length])
+            for length in range(step, max_length + 1, step)]
+
+
+def dialog_sentences(filename="data/all_dialogs.txt", limit=None):
+    """The distinct user turns of the dialogs"""
+    sentences = []
+    seen = set()
+    for sentence in read_sentences(filename):
+        if sentence not in seen:
+            seen.add(sentence)
+            sentences.append(sentence)
+    return sentences[:limit]
+
+
+def measure(sentence, method="chart", memory=True, **budget):
+    """
+    Deduct one sentence
+    Returns wall time, derivations explored and peak memory
+    """
+    stats["derivations"] = 0
+    start = time.perf_counter()
+    tree = deduct_sentence(sentence, method=method, **budget)
+    seconds = time.perf_counter() - start
+    result = {"sentence": sentence,
+              "words": len(sentence.split(" ")),
+              "seconds": seconds,
+              "derivations": stats["derivations"],
+              "constituents": len(tree[-1][0]) if tree else 0}
+    if memory:
+        # a second run, tracing slows down the deduction
+        tracemalloc.start()
+        deduct_sentence(sentence, method=method, **budget)
+        result["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def summarise(results):
+    times = [result["seconds"] for result in results]
+    summary = {"sentences": len(results),
+               "total": sum(times),
+               "mean": sum(times) / len(times) if times else 0.0,
+               "p50": percentile(times, 50),
+               "p95": percentile(times, 95),
+               "p99": percentile(times, 99),
+               "max": max(times) if times else 0.0,
+               "derivations": sum(result["derivations"]
+                                  for result in results)}
+    if results and "peak_kib" in results[0]:
+        summary["peak_kib"] = max(result["peak_kib"] for result in results)
+    return summary
+
+
+def run(suites, method="chart", memory=True, **budget):
+    """Benchmark every suite, a dict of name -> list of sentences"""
+    # load the grammar and lexicon before timing
+    deduct_sentence(all_inputs[0], method=method, **budget)
+    report = {"method": method, "budget": budget, "suites": {}}
+    for name, sentences in suites.items():
+        results = [measure(sentence, method, memory, **budget)
+                   for sentence in sentences]
+        report["suites"][name] = {"summary": summarise(results),
+                                  "sentences": results}
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Compare the summaries to a baseline report
+    Returns a list of regressions: (suite, measure, baseline, current)
+    """
+    regressions = []
+    for name, suite in report["suites"].items():
+        if name not in baseline["suites"]:
+            continue
+        old = baseline["suites"][name]["summary"]
+        new = suite["summary"]
+        for measure in ["p50", "p95", "p99", "derivations", "peak_kib"]:
+            if measure not in old or measure not in new:
+                continue
+            if new[measure] > old[measure] * (1 + tolerance):
+                regressions.append((name, measure, old[measure],
+                                    new[measure]))
+    return regressions
+
+
+def print_summary(report):
+    for name, suite in report["suites"].items():
+        summary = suite["summary"]
+        print("{} ({} sentences, {} derivations)".format(
+            name.ljust(10), summary["sentences"], summary["derivations"]))
+        print("   p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms, "
+              "max {:.2f} ms".format(summary["p50"] * 1000,
+                                     summary["p95"] * 1000,
+                                     summary["p99"] * 1000,
+                                     summary["max"] * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the deduction")
+    parser.add_argument("-m", "--method", default="chart",
+                        choices=["chart", "beam", "exhaustive"])
+    parser.add_argument("-o", "--output", help="json file to write")
+    parser.add_argument("-b", "--baseline", help="json file to compare to")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+                        help="allowed relative increase over the baseline")
+    parser.add_argument("-l", "--limit", type=int,
+                        help="number of dialog sentences")
+    parser.add_argument("--max-length", type=int, default=40,
+                        help="words in the longest synthetic sentence")
+    parser.add_argument("--max-nodes", type=int,
+                        help="node budget of the beam method")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip measuring the peak memory")
+    args = parser.parse_args()
+
+    budget = {}
+    if args.method == "beam" and args.max_nodes:
+        budget["max_nodes"] = args.max_nodes
+    suites = {"all_inputs": all_inputs,
+              "dialogs": dialog_sentences(limit=args.limit),
+              "synthetic": synthetic_sentences(args.max_length)}
+    report = run(suites, args.method, not args.no_memory, **budget)
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for name, measure, old, new in regressions:
+            print("regression in {} {}: {:.6g} -> {:.6g}".format(
+                name, measure, old, new))
+        if regressions:
+            sys.exit(1)
@@ -1,5 +1,7 @@
 from deduction_algorithm import deduct_preferences, variable_val_keys
 from text_classification import SpeechActModel
+from fast_classifier import HashedClassifier, CascadeClassifier
+from restaurant_index import RestaurantIndex
 from utils import uinput, dbprint, talk, closest_word, uinput
 import csv
 import json
@@ -170,14 +172,27 @@ class DialogSystem:
     """
     Main class for dialog system
     """
-    def __init__(self, sam=None):
+    def __init__(self, sam=None, fast_threshold=0.95,
+                 fast_path="fast_classifier.npz"):
+        """
+        param sam: speechact classifier, trained when not given
+        param fast_threshold: confidence the hashed classifier needs to
+                              answer before the trained model,
+                              None to only use the trained model
+        param fast_path: file of the hashed classifier, trained and
+                         saved when missing
+        """
         self.active = True
         # speechact classifier
         if not sam:
-            self.sam = SpeechActModel(retrain=True, n_epochs=5, embd_size=512,
-                                      lstm_size=64, drop_rate=0.5)
-        else:
-            self.sam = sam
+            sam = SpeechActModel(retrain=True, n_epochs=5, embd_size=512,
+                                 lstm_size=64, drop_rate=0.5)
+            if fast_threshold is not None:
+                # cheap hashed classifier first, LSTM only for unsure cases
+                sam = CascadeClassifier(
+                    HashedClassifier.load_or_train(fast_path), sam,
+                    threshold=fast_threshold)
+        self.sam = sam
         # keywords for information requests
         self.reqkeys = self.keywords_from_json()
         # what slots are not filled yet
@@ -196,6 +211,8 @@ class DialogSystem:
         self.order = []
         # restaurant information
         self.restaurant_info = self.restaurants_from_csv()
+        # posting lists of the restaurants by area, food and pricerange
+        self.restaurant_index = RestaurantIndex(self.restaurant_info)
         # restaurants that fulfill the current requirements
         self.restaurants = []
         # restaurants that have already been recommended
@@ -323,21 +340,7 @@ class DialogSystem:
         dbprint(" area: {}".format(self.preference["area"]))
         dbprint(" food: {}".format(self.preference["food"]))
         dbprint("price: {}".format(self.preference["pricerange"]))
-        restaurants = []
-        for element in self.restaurant_info:
-            area, food, price = False, False, False
-            if element["area"] == self.preference["area"]\
-               or not self.preference["area"]:
-                area = True
-            if element["food"] == self.preference["food"]\
-               or not self.preference["food"]:
-                food = True
-            if element["pricerange"] == self.preference["pricerange"]\
-               or not self.preference["pricerange"]:
-                price = True
-            if area and food and price:
-                restaurants.append(element)
-        self.restaurants = restaurants
+        self.restaurants = self.restaurant_index.query(**self.preference)
 
     def fill_restaurant_slots(self):
         """
@@ -410,6 +413,7 @@ if __name__ == "__main__":
     print("Training model...")
     sam = SpeechActModel(retrain=True, n_epochs=5, embd_size=256,
                          lstm_size=64, drop_rate=0.5)
+    sam = CascadeClassifier(HashedClassifier.load_or_train(), sam)
     while True:
         ds = DialogSystem(sam=sam)
         ds.interact()
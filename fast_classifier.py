@@ -0,0 +1,233 @@
+import argparse
+import os
+import zlib
+import numpy as np
+from data_retrieval import return_speechacts, SPEECHACT_FILES
+from utils import norm_input, file_hash
+
+
+class HashedClassifier:
+    """
+    Linear softmax classifier over hashed word n-grams, trained with NumPy
+    Fast enough to answer the easy speech acts before the LSTM
+    """
+
+    def __init__(self, n_features=2 ** 14, ngrams=2, epochs=30,
+                 learning_rate=0.5, batch_size=256, seed=0):
+        self.n_features = n_features
+        self.ngrams = ngrams
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.seed = seed
+        self.classes = np.array([])
+        self.weights = None
+        self.bias = None
+
+    def features(self, sentence):
+        """Hashed indices of the n-grams of a sentence"""
+        words = ["<s>"] + norm_input(sentence).split() + ["</s>"]
+        grams = []
+        for n in range(1, self.ngrams + 1):
+            for i in range(len(words) - n + 1):
+                grams.append(" ".join(words[i:i + n]))
+        return [zlib.crc32(gram.encode()) % self.n_features
+                for gram in grams]
+
+    def logits(self, features):
+        """Scores of every class for a list of feature lists"""
+        rows = np.repeat(np.arange(len(features)),
+                         [len(f) for f in features])
+        cols = np.concatenate([np.asarray(f, dtype=np.int64)
+                               for f in features])
+        scores = np.tile(self.bias, (len(features), 1))
+        np.add.at(scores, rows, self.weights[cols])
+        return scores, rows, cols
+
+    def fit(self, sentences, labels):
+        """
+        Train on sentences with their speech acts,
+        duplicate sentences are trained once with their count as weight
+        """
+        counts = {}
+        for sentence, label in zip(sentences, labels):
+            key = (norm_input(sentence), label)
+            counts[key] = counts.get(key, 0) + 1
+        self.classes = np.array(sorted(set(labels)))
+        index = dict((label, i) for i, label in enumerate(self.classes))
+        samples = list(counts)
+        features = [self.features(sentence) for sentence, _ in samples]
+        targets = np.array([index[label] for _, label in samples])
+        sample_weight = np.array([counts[s] for s in samples], dtype=float)
+        sample_weight /= sample_weight.mean()
+
+        rng = np.random.RandomState(self.seed)
+        self.weights = np.zeros((self.n_features, len(self.classes)))
+        self.bias = np.zeros(len(self.classes))
+        # adagrad keeps rare n-grams learning
+        w_squares = np.full_like(self.weights, 1e-8)
+        b_squares = np.full_like(self.bias, 1e-8)
+        for _ in range(self.epochs):
+            order = rng.permutation(len(samples))
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                scores, rows, cols = self.logits([features[i] for i in batch])
+                probs = softmax(scores)
+                probs[np.arange(len(batch)), targets[batch]] -= 1
+                probs *= sample_weight[batch, np.newaxis] / len(batch)
+                w_grad = np.zeros_like(self.weights)
+                np.add.at(w_grad, cols, probs[rows])
+                b_grad = probs.sum(axis=0)
+                w_squares += w_grad ** 2
+                b_squares += b_grad ** 2
+                self.weights -= self.learning_rate * w_grad / \
+                    np.sqrt(w_squares)
+                self.bias -= self.learning_rate * b_grad / np.sqrt(b_squares)
+        return self
+
+    def predict_proba(self, sentences):
+        """Array (sentences x classes) in the order of classes"""
+        scores, _, _ = self.logits([self.features(s) for s in sentences])
+        return softmax(scores)
+
+    def predict(self, sentences, threshold=0.0):
+        """
+        Speech acts of the sentences and whether the confidence
+        reaches threshold
+        """
+        probs = self.predict_proba(sentences)
+        best = np.argmax(probs, axis=1)
+        confident = probs[np.arange(len(probs)), best] >= threshold
+        return self.classes[best], confident
+
+    def save(self, filename="fast_classifier.npz"):
+        np.savez(filename, weights=self.weights, bias=self.bias,
+                 classes=self.classes,
+                 settings=np.array([self.n_features, self.ngrams]),
+                 data_hash=np.array(getattr(self, "data_hash", "")))
+
+    @classmethod
+    def load(cls, filename="fast_classifier.npz"):
+        with np.load(filename) as data:
+            n_features, ngrams = data["settings"]
+            classifier = cls(n_features=int(n_features), ngrams=int(ngrams))
+            classifier.weights = data["weights"]
+            classifier.bias = data["bias"]
+            classifier.classes = data["classes"]
+            if "data_hash" in data:
+                classifier.data_hash = str(data["data_hash"])
+        return classifier
+
+    @classmethod
+    def from_speechacts(cls, **kwargs):
+        """Train on speechacts_train.txt"""
+        train_data, _ = return_speechacts()
+        sentences, labels = split_speechacts(train_data)
+        classifier = cls(**kwargs).fit(sentences, labels)
+        classifier.data_hash = file_hash(SPEECHACT_FILES)
+        return classifier
+
+    @classmethod
+    def load_or_train(cls, filename="fast_classifier.npz"):
+        """
+        The saved classifier when it was trained on the current
+        speechact files, else train one and save it
+        """
+        if os.path.exists(filename):
+            classifier = cls.load(filename)
+            if getattr(classifier, "data_hash", "") == \
+                    file_hash(SPEECHACT_FILES):
+                return classifier
+        classifier = cls.from_speechacts()
+        classifier.save(filename)
+        return classifier
+
+
+class CascadeClassifier:
+    """
+    Answers with the hashed classifier when it is confident enough,
+    else asks the speech act model
+    """
+
+    def __init__(self, fast, sam, threshold=0.95):
+        self.fast = fast
+        self.sam = sam
+        self.threshold = threshold
+        self.answered = 0
+        self.deferred = 0
+
+    def sentence_prediction(self, sentence, echo=False):
+        labels, confident = self.fast.predict([sentence], self.threshold)
+        if confident[0]:
+            self.answered += 1
+            if echo:
+                print("fast -> " + labels[0])
+            return str(labels[0])
+        self.deferred += 1
+        return self.sam.sentence_prediction(sentence, echo=echo)
+
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def split_speechacts(data):
+    """Lines of a speechact file to sentences and labels"""
+    labels = [t.split(' ')[0] for t in data]
+    sentences = [" ".join(t.split(' ')[1:]) for t in data]
+    return sentences, labels
+
+
+def report(fast, sentences, labels, thresholds, fallback=None):
+    """
+    Coverage and accuracy of the hashed classifier per threshold
+    param fallback: predictions of the speech act model, to also report
+                    the accuracy of the cascade
+    returns a list of dicts, one per threshold
+    """
+    labels = np.asarray(labels)
+    probs = fast.predict_proba(sentences)
+    best = np.argmax(probs, axis=1)
+    predicted = fast.classes[best]
+    confidence = probs[np.arange(len(probs)), best]
+    rows = []
+    for threshold in thresholds:
+        confident = confidence >= threshold
+        row = {"threshold": threshold,
+               "coverage": confident.mean(),
+               "accuracy": (predicted[confident] ==
+                            labels[confident]).mean()
+               if confident.any() else 0.0}
+        if fallback is not None:
+            cascade = np.where(confident, predicted, np.asarray(fallback))
+            row["cascade_accuracy"] = (cascade == labels).mean()
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train the hashed classifier and report on the test data")
+    parser.add_argument("-o", "--output", default="fast_classifier.npz")
+    parser.add_argument("--cascade", action="store_true",
+                        help="also report the cascade with the saved model")
+    args = parser.parse_args()
+
+    train_data, test_data = return_speechacts()
+    fast = HashedClassifier.from_speechacts()
+    fast.save(args.output)
+    sentences, labels = split_speechacts(test_data)
+    fallback = None
+    if args.cascade:
+        from text_classification import SpeechActModel
+        fallback = SpeechActModel(retrain=False).predict_batch(sentences)
+        print("model accuracy: {:.4f}".format(
+            (fallback == np.asarray(labels)).mean()))
+    thresholds = [0.5, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99]
+    for row in report(fast, sentences, labels, thresholds, fallback):
+        line = "threshold {threshold:.2f}: coverage {coverage:.4f}, " \
+               "accuracy {accuracy:.4f}".format(**row)
+        if "cascade_accuracy" in row:
+            line += ", cascade {cascade_accuracy:.4f}".format(**row)
+        print(line)
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import numpy as np
+from utils import norm_input, DeleteIndex
+from vectorizer import Vectorizer
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def linear(x):
+    return x
+
+
+def matmul(x, weight, scale=None):
+    """x.dot(weight) for float32, float16 and int8 weights"""
+    y = x.dot(weight.astype(np.float32, copy=False))
+    if scale is not None:
+        y *= scale
+    return y
+
+
+ACTIVATIONS = {"sigmoid": sigmoid,
+               "hard_sigmoid": hard_sigmoid,
+               "relu": relu,
+               "softmax": softmax,
+               "tanh": np.tanh,
+               "linear": linear}
+
+
+def export_model(model, filename="model.npz"):
+    """
+    Dump the layers of a trained Sequential model to a npz file
+    Supports the layers of SpeechActModel.make_model
+    """
+    config = []
+    arrays = {}
+    for i, layer in enumerate(model.layers):
+        name = type(layer).__name__
+        layer_config = layer.get_config()
+        if name == "Embedding":
+            entry = {"type": name,
+                     "mask_zero": bool(layer_config.get("mask_zero"))}
+        elif name == "LSTM":
+            if layer_config.get("return_sequences") or \
+               layer_config.get("go_backwards"):
+                raise ValueError("only a forward LSTM returning the last "
+                                 "output is supported")
+            entry = {"type": name,
+                     "units": layer_config["units"],
+                     "activation": layer_config["activation"],
+                     "recurrent_activation":
+                         layer_config["recurrent_activation"]}
+        elif name == "Dense":
+            entry = {"type": name, "activation": layer_config["activation"]}
+        elif name == "Activation":
+            entry = {"type": name, "activation": layer_config["activation"]}
+        elif name == "Dropout":
+            # dropout does nothing at inference
+            continue
+        else:
+            raise ValueError("layer {} is not supported".format(name))
+        weights = layer.get_weights()
+        entry["weights"] = len(weights)
+        for j, weight in enumerate(weights):
+            arrays["{}_{}".format(len(config), j)] = weight
+        config.append(entry)
+    np.savez(filename, config=np.array(json.dumps(config)), **arrays)
+
+
+def quantize_array(weight, dtype):
+    """
+    Reduced precision copy of a weight matrix
+    float16: plain cast, returns (weight, None)
+    int8: symmetric with one float32 scale per output unit, that is
+          per row of an embedding and per column of a kernel,
+          returns (quantized, scale)
+    """
+    if dtype == "float16":
+        return weight.astype(np.float16), None
+    if dtype != "int8":
+        raise ValueError("dtype {} is not supported".format(dtype))
+    axis = 1 if weight.ndim == 2 else None
+    scale = np.max(np.abs(weight), axis=axis) / 127
+    scale = np.where(scale == 0, 1, scale).astype(np.float32)
+    if axis == 1:
+        quantized = np.round(weight / scale[:, np.newaxis])
+    else:
+        quantized = np.round(weight / scale)
+    return quantized.astype(np.int8), scale
+
+
+def quantize_model(filename="model.npz", out=None, dtype="int8"):
+    """
+    Store the matrices of an exported model in float16 or int8,
+    biases stay float32
+    writes to model.<dtype>.npz next to filename unless out is given
+    """
+    out = out or filename.replace(".npz", ".{}.npz".format(dtype))
+    arrays = {}
+    with np.load(filename) as data:
+        config = json.loads(str(data["config"]))
+        for i, entry in enumerate(config):
+            for j in range(entry["weights"]):
+                key = "{}_{}".format(i, j)
+                weight = data[key]
+                if weight.ndim != 2:
+                    arrays[key] = weight
+                    continue
+                if entry["type"] == "Embedding":
+                    weight, scale = quantize_array(weight, dtype)
+                else:
+                    # kernels are (inputs x units), scale per unit
+                    weight, scale = quantize_array(weight.T, dtype)
+                    weight = weight.T
+                arrays[key] = weight
+                if scale is not None:
+                    arrays[key + "_scale"] = scale
+        np.savez(out, config=data["config"], **arrays)
+    return out
+
+
+class NumpyModel:
+    """
+    Forward pass of an exported Embedding -> LSTM -> Dense model
+    in plain NumPy, does not need Keras or TensorFlow
+    Reads the files of quantize_model as well, the weights are kept
+    in their reduced precision and only widened where they are used
+    """
+
+    def __init__(self, filename="model.npz"):
+        with np.load(filename) as data:
+            self.config = json.loads(str(data["config"]))
+            self.weights = []
+            self.scales = []
+            for i, entry in enumerate(self.config):
+                keys = ["{}_{}".format(i, j)
+                        for j in range(entry["weights"])]
+                self.weights.append([data[key] for key in keys])
+                self.scales.append([data[key + "_scale"]
+                                    if key + "_scale" in data else None
+                                    for key in keys])
+
+    @property
+    def nbytes(self):
+        """Memory held by the weights"""
+        return sum(weight.nbytes for weights in self.weights + self.scales
+                   for weight in weights if weight is not None)
+
+    def predict(self, x, batch_size=256):
+        """
+        Same as model.predict for an array of token sequences
+        returns an array (sentences x outputs)
+        """
+        x = np.asarray(x)
+        if x.size == 0:
+            # no sentences, gives an empty (0 x outputs) array
+            return self.forward(np.zeros((0, x.shape[-1] if x.ndim > 1
+                                          else 0), dtype=np.int32))
+        if x.ndim == 1:
+            x = x[np.newaxis, :]
+        outputs = [self.forward(x[i:i + batch_size])
+                   for i in range(0, len(x), batch_size)]
+        return np.concatenate(outputs, axis=0)
+
+    def forward(self, x):
+        mask = None
+        for entry, weights, scales in zip(self.config, self.weights,
+                                          self.scales):
+            layer = entry["type"]
+            if layer == "Embedding":
+                tokens = x
+                if entry.get("mask_zero"):
+                    mask = tokens != 0
+                x = weights[0][tokens].astype(np.float32)
+                if scales[0] is not None:
+                    x *= scales[0][tokens][..., np.newaxis]
+            elif layer == "LSTM":
+                x = self.lstm(x, entry, weights, scales, mask)
+            elif layer == "Dense":
+                x = matmul(x, weights[0], scales[0])
+                if len(weights) > 1:
+                    x = x + weights[1]
+                x = ACTIVATIONS[entry["activation"]](x)
+            elif layer == "Activation":
+                x = ACTIVATIONS[entry["activation"]](x)
+        return x
+
+    @staticmethod
+    def lstm(x, entry, weights, scales, mask=None):
+        """
+        LSTM over the time steps of x, returns the last output
+        masked time steps keep the state of the step before
+        """
+        kernel, recurrent_kernel = weights[:2]
+        bias = weights[2] if len(weights) > 2 else None
+        units = entry["units"]
+        activation = ACTIVATIONS[entry["activation"]]
+        recurrent_activation = ACTIVATIONS[entry["recurrent_activation"]]
+        # the input part of the gates for all time steps at once
+        z_x = matmul(x, kernel, scales[0])
+        if bias is not None:
+            z_x = z_x + bias
+        h = np.zeros((x.shape[0], units), dtype=z_x.dtype)
+        c = np.zeros((x.shape[0], units), dtype=z_x.dtype)
+        for t in range(x.shape[1]):
+            z = z_x[:, t] + matmul(h, recurrent_kernel, scales[1])
+            # gates in the order of Keras: input, forget, cell, output
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            c_t = f * c + i * activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            h_t = o * activation(c_t)
+            if mask is None:
+                h, c = h_t, c_t
+            else:
+                keep = mask[:, t, np.newaxis]
+                h = np.where(keep, h_t, h)
+                c = np.where(keep, c_t, c)
+        return h
+
+
+class NumpySpeechActModel:
+    """
+    Speech act prediction from a saved SpeechActModel artifact
+    without Keras or TensorFlow: the vocabularies of manifest.json,
+    the spelling correction, Vectorizer and a NumpyModel
+    param weights: npz file in path, model.npz or one of quantize_model
+    """
+
+    def __init__(self, path="model", weights="model.npz"):
+        with open(os.path.join(path, "manifest.json")) as json_file:
+            manifest = json.load(json_file)
+        self.sentence_size = manifest["params"]["sentence_size"]
+        # lists of pairs, the oov token of the sentences is 1
+        word_index = dict((word, index) for word, index
+                          in manifest["word_index_x"])
+        self.spelling = DeleteIndex(word_index, treshold=0.8)
+        self.vectorizer = Vectorizer(word_index, self.sentence_size,
+                                     oov_token=1)
+        labels = sorted((index, speechact) for speechact, index
+                        in manifest["word_index_y"])
+        self.label_indices = np.array([index for index, _ in labels])
+        self.label_names = np.array([speechact for _, speechact in labels])
+        self.model = NumpyModel(os.path.join(path, weights))
+
+    def typing_errors(self, sentence):
+        corrected = []
+        for word in sentence.split(" "):
+            corrected.append(self.spelling.closest(word) or word)
+        return " ".join(corrected)
+
+    def predict_batch(self, sentences, batch_size=256, probabilities=False):
+        """
+        Predicts the speech acts of many sentences, like
+        SpeechActModel.predict_batch
+        returns an array of speechacts, with probabilities also
+        an array (sentences x speechacts) in the order of label_names
+        """
+        corrected = [self.typing_errors(norm_input(sentence))
+                     for sentence in sentences]
+        x = self.vectorizer.transform(corrected)
+        pr = self.model.predict(x, batch_size=batch_size)
+        pr = pr[:, self.label_indices]
+        speechacts = self.label_names[np.argmax(pr, axis=1)]
+        if probabilities:
+            return speechacts, pr
+        return speechacts
+
+    def sentence_prediction(self, sentence, echo=False):
+        """
+        Predicts the speech act of one sentence
+        param echo: print the predictions to the console
+        """
+        speechacts, pr = self.predict_batch([sentence], probabilities=True)
+        if echo:
+            for i in np.argsort(pr[0]):
+                print(str(round(pr[0][i] * 100, 2)).rjust(7) + " -> " +
+                      self.label_names[i])
+        return speechacts[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Quantize an exported model")
+    parser.add_argument("model", nargs="?", default="model/model.npz",
+                        help="npz file of export_model")
+    parser.add_argument("-d", "--dtype", default="int8",
+                        choices=["float16", "int8"])
+    parser.add_argument("-o", "--out", help="output npz file")
+    args = parser.parse_args()
+    out = quantize_model(args.model, args.out, args.dtype)
+    print("{}: {:.2f} MB -> {}: {:.2f} MB".format(
+        args.model, NumpyModel(args.model).nbytes / 2**20,
+        out, NumpyModel(out).nbytes / 2**20))
@@ -1,6 +1,8 @@
+import os
 import time
 import matplotlib
-matplotlib.use("TkAgg")
+# without a display the plots can still be written to file
+matplotlib.use("TkAgg" if os.environ.get("DISPLAY") else "Agg")
 import matplotlib.pyplot as plt
 from keras.utils import plot_model
 
@@ -8,8 +10,10 @@ from keras.utils import plot_model
 def plot_myhistory(histories, time, epochs):
     f, (ax1, ax2) = plt.subplots(2, sharex=True, figsize=(8, 10))
     for history in histories:
-        ax1.plot(history.history['acc'], color='blue')
-        ax1.plot(history.history['val_acc'], color='red')
+        # older Keras versions call the accuracy acc
+        acc = 'acc' if 'acc' in history.history else 'accuracy'
+        ax1.plot(history.history[acc], color='blue')
+        ax1.plot(history.history['val_' + acc], color='red')
         ax2.plot(history.history['loss'], color='cyan')
         ax2.plot(history.history['val_loss'], color='magenta')
     ax1.set_title('model accuracy')
@@ -32,6 +36,7 @@ def plot_mymodel(model, time):
 
 def plot_classifier(histories, model, n_epochs):
     t = time.strftime("%m-%d-%H:%M:%S")
+    os.makedirs("plots", exist_ok=True)
     plot_myhistory(histories, t, n_epochs)
     plot_mymodel(model, t)
 
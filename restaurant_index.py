@@ -0,0 +1,51 @@
+class RestaurantIndex:
+    """
+    In-memory index of the restaurant table over the preference fields
+    Every value of a field has a posting list of the rows that have it,
+    a query walks the shortest posting list of its preferences and keeps
+    the rows that are in the posting sets of the others
+    """
+
+    def __init__(self, restaurants, fields=("area", "food", "pricerange")):
+        self.restaurants = list(restaurants)
+        self.fields = fields
+        # field -> value -> row numbers in table order
+        self.postings = dict((field, {}) for field in fields)
+        for i, restaurant in enumerate(self.restaurants):
+            for field in fields:
+                self.postings[field].setdefault(restaurant[field],
+                                                []).append(i)
+        self.sets = dict((field, dict((value, set(rows))
+                                      for value, rows in values.items()))
+                         for field, values in self.postings.items())
+
+    def __len__(self):
+        return len(self.restaurants)
+
+    def values(self, field):
+        """The values of field in the table"""
+        return list(self.postings[field])
+
+    def rows(self, **preferences):
+        """
+        Row numbers, in table order, of the restaurants that satisfy
+        the preferences, an empty preference matches anything
+        """
+        wanted = [(field, value) for field, value in preferences.items()
+                  if value]
+        if not wanted:
+            return list(range(len(self.restaurants)))
+        for field, _ in wanted:
+            if field not in self.postings:
+                raise KeyError("{} is not indexed".format(field))
+        postings = [self.postings[field].get(value, [])
+                    for field, value in wanted]
+        shortest = min(range(len(wanted)), key=lambda i: len(postings[i]))
+        others = [self.sets[field].get(value, set())
+                  for i, (field, value) in enumerate(wanted) if i != shortest]
+        return [row for row in postings[shortest]
+                if all(row in rows for rows in others)]
+
+    def query(self, **preferences):
+        """The restaurants that satisfy the preferences, in table order"""
+        return [self.restaurants[row] for row in self.rows(**preferences)]
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import sys
+import time
+from data_retrieval import return_speechacts
+from text_classification import SpeechActModel
+from utils import norm_input, percentile, rss_mib
+
+
+STAGES = ["norm", "typing_errors", "tokenize", "forward", "total"]
+
+
+def test_sentences(limit=None):
+    """The sentences of speechacts_test.txt, without their label"""
+    _, test_data = return_speechacts()
+    sentences = [" ".join(line.split(" ")[1:]) for line in test_data]
+    return sentences[:limit]
+
+
+def measure(sam, sentence):
+    """
+    The steps of sentence_prediction for one sentence, timed apart
+    Returns the seconds of every stage
+    """
+    times = {}
+    start = time.perf_counter()
+    sentence = norm_input(sentence)
+    times["norm"] = time.perf_counter() - start
+    step = time.perf_counter()
+    sentence = sam.typing_errors(sentence)
+    times["typing_errors"] = time.perf_counter() - step
+    step = time.perf_counter()
+    sentence_tok = sam.vectorizer.pad([sam.vectorizer.ids(sentence)])
+    times["tokenize"] = time.perf_counter() - step
+    step = time.perf_counter()
+    sam.model.predict(sentence_tok, verbose=0)
+    times["forward"] = time.perf_counter() - step
+    times["total"] = time.perf_counter() - start
+    return times
+
+
+def summarise(times):
+    return {"mean": sum(times) / len(times) if times else 0.0,
+            "p50": percentile(times, 50),
+            "p95": percentile(times, 95),
+            "p99": percentile(times, 99),
+            "max": max(times) if times else 0.0}
+
+
+def latency(sam, sentences):
+    """Per stage latency of single sentence predictions"""
+    results = [measure(sam, sentence) for sentence in sentences]
+    return dict((stage, summarise([result[stage] for result in results]))
+                for stage in STAGES)
+
+
+def throughput(sam, sentences, batch_sizes=(1, 16, 64, 256)):
+    """
+    Sentences per second of predict_batch, called with batch_size
+    sentences at a time, without the prediction cache
+    """
+    report = {}
+    for batch_size in batch_sizes:
+        sam.predictions.clear()
+        start = time.perf_counter()
+        for i in range(0, len(sentences), batch_size):
+            sam.predictions.clear()
+            sam.predict_batch(sentences[i:i + batch_size],
+                              batch_size=batch_size)
+        seconds = time.perf_counter() - start
+        report[str(batch_size)] = {"seconds": seconds,
+                                   "sentences_per_second":
+                                       len(sentences) / seconds}
+    return report
+
+
+def run(sam, sentences, batch_sizes=(1, 16, 64, 256)):
+    # the first predict builds the graph, keep it out of the timings
+    sam.predict_batch(sentences[:1])
+    report = {"sentences": len(sentences),
+              "rss_loaded": rss_mib(),
+              "latency": latency(sam, sentences),
+              "throughput": throughput(sam, sentences, batch_sizes)}
+    report["rss"] = rss_mib()
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Compare to a baseline report
+    Returns a list of regressions: (measure, baseline, current)
+    """
+    regressions = []
+    for stage in STAGES:
+        old = baseline["latency"].get(stage, {})
+        new = report["latency"][stage]
+        for p in ["p50", "p95", "p99"]:
+            if p in old and new[p] > old[p] * (1 + tolerance):
+                regressions.append(("{} {}".format(stage, p), old[p], new[p]))
+    for batch_size, new in report["throughput"].items():
+        old = baseline["throughput"].get(batch_size)
+        if old and new["sentences_per_second"] < \
+                old["sentences_per_second"] * (1 - tolerance):
+            regressions.append(("batch {} sentences/s".format(batch_size),
+                                old["sentences_per_second"],
+                                new["sentences_per_second"]))
+    old = baseline["rss"]["peak_mib"]
+    new = report["rss"]["peak_mib"]
+    if old and new and new > old * (1 + tolerance):
+        regressions.append(("peak rss", old, new))
+    return regressions
+
+
+def print_summary(report):
+    print("latency of {} sentences".format(report["sentences"]))
+    for stage in STAGES:
+        summary = report["latency"][stage]
+        print("   {} p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms".format(
+            stage.ljust(14), summary["p50"] * 1000, summary["p95"] * 1000,
+            summary["p99"] * 1000))
+    print("throughput")
+    for batch_size, result in report["throughput"].items():
+        print("   batch {} {:.0f} sentences/s".format(
+            batch_size.rjust(4), result["sentences_per_second"]))
+    print("rss {:.0f} MiB, peak {:.0f} MiB".format(
+        report["rss"]["current_mib"] or 0, report["rss"]["peak_mib"] or 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the speech act prediction")
+    parser.add_argument("-p", "--path", default="model",
+                        help="model artifact, trained when missing")
+    parser.add_argument("-o", "--output", help="json file to write")
+    parser.add_argument("-b", "--baseline", help="json file to compare to")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+                        help="allowed relative change from the baseline")
+    parser.add_argument("-l", "--limit", type=int,
+                        help="number of test sentences")
+    parser.add_argument("--batch-sizes", type=int, nargs="+",
+                        default=[1, 16, 64, 256])
+    args = parser.parse_args()
+
+    retrain = not os.path.exists(os.path.join(args.path, "manifest.json"))
+    sam = SpeechActModel(retrain=retrain, path=args.path)
+    report = run(sam, test_sentences(args.limit), args.batch_sizes)
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for name, old, new in regressions:
+            print("regression in {}: {:.6g} -> {:.6g}".format(name, old, new))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,188 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+
+# the models of the_big_test
+BIG_TEST = [dict(n_epochs=5, embd_size=64, lstm_size=64),
+            dict(n_epochs=5, embd_size=265, lstm_size=64),
+            dict(n_epochs=5, embd_size=16, lstm_size=32),
+            dict(n_epochs=20, embd_size=64, lstm_size=256, den1_size=128),
+            dict(n_epochs=5, embd_size=64, lstm_size=32, den1_size=32),
+            dict(n_epochs=5, embd_size=64, lstm_size=32, den1_size=32,
+                 drop_rate=0.25),
+            dict(n_epochs=5, embd_size=64, lstm_size=32, den1_size=32,
+                 drop_rate=0.5),
+            dict(n_epochs=5, embd_size=512, lstm_size=64, drop_rate=0.5)]
+
+# columns of the results table
+COLUMNS = ["trial", "accuracy", "loss", "epochs", "stopped",
+           "train_time", "latency", "params"]
+
+
+def grid(space):
+    """
+    All combinations of a search space,
+    a dict of SpeechActModel parameter -> list of values
+    """
+    params = sorted(space)
+    return [dict(zip(params, values))
+            for values in itertools.product(*(space[p] for p in params))]
+
+
+def random_search(space, n, seed=None):
+    """n random combinations of a search space"""
+    rng = random.Random(seed)
+    return [dict((param, rng.choice(values))
+                 for param, values in sorted(space.items()))
+            for _ in range(n)]
+
+
+def init_trial(threads):
+    """Limit the threads of a worker before TensorFlow is imported"""
+    for variable in ["OMP_NUM_THREADS",
+                     "TF_NUM_INTRAOP_THREADS",
+                     "TF_NUM_INTEROP_THREADS"]:
+        os.environ[variable] = str(threads)
+
+
+def run_trial(trial, params, out, scores, grace, min_trials):
+    """
+    Train one configuration, stop when its validation accuracy is below
+    the median of the other trials at the same epoch
+    """
+    from keras.callbacks import Callback
+    from text_classification import SpeechActModel
+
+    class MedianStopping(Callback):
+        def on_train_begin(self, logs=None):
+            self.start = time.time()
+            self.epochs = 0
+            self.stopped = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            logs = logs or {}
+            self.epochs = epoch + 1
+            accuracy = logs.get("val_acc", logs.get("val_accuracy"))
+            if scores is None or accuracy is None:
+                return
+            others = [acc for e, acc in list(scores) if e == epoch]
+            scores.append((epoch, accuracy))
+            last = epoch + 1 >= self.params.get("epochs", 0)
+            if epoch + 1 >= grace and not last and \
+               len(others) >= min_trials and \
+               accuracy < statistics.median(others):
+                self.stopped = True
+                self.model.stop_training = True
+
+        def on_train_end(self, logs=None):
+            self.train_time = time.time() - self.start
+
+    stopping = MedianStopping()
+    s = SpeechActModel(retrain=True,
+                       path=os.path.join(out, "trial_{}".format(trial)),
+                       callbacks=[stopping],
+                       **params)
+    loss, accuracy = s.evaluation[:2]
+    # latency of a single sentence through the batch path,
+    # without the prediction cache
+    latencies = []
+    for sentence in s.x_test[:20]:
+        s.predictions.clear()
+        start = time.perf_counter()
+        s.predict_batch([sentence])
+        latencies.append(time.perf_counter() - start)
+    return {"trial": trial,
+            "accuracy": accuracy,
+            "loss": loss,
+            "epochs": stopping.epochs,
+            "stopped": stopping.stopped,
+            "train_time": stopping.train_time,
+            "latency": statistics.median(latencies),
+            "params": params}
+
+
+def run_trial_args(args):
+    return run_trial(*args)
+
+
+def run_sweep(trials, repeats=1, processes=None, threads=1,
+              early_stopping=True, grace=1, min_trials=2, out="sweeps"):
+    """
+    Train every configuration in trials repeats times in a pool
+    of processes with threads threads each
+    Writes results.csv and results.json to a new directory in out
+    returns the results, the best accuracy first
+    """
+    out = os.path.join(out, time.strftime("%m-%d-%H:%M:%S"))
+    os.makedirs(out, exist_ok=True)
+    trials = [params for params in trials for _ in range(repeats)]
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() // threads)
+    # spawned workers import TensorFlow after their threads are limited
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    scores = manager.list() if early_stopping else None
+    pool = context.Pool(processes, initializer=init_trial,
+                        initargs=(threads,))
+    try:
+        jobs = [(trial, params, out, scores, grace, min_trials)
+                for trial, params in enumerate(trials)]
+        results = []
+        for result in pool.imap_unordered(run_trial_args, jobs):
+            print("trial {trial}: accuracy {accuracy:.4f}, "
+                  "{epochs} epochs".format(**result))
+            results.append(result)
+    finally:
+        pool.terminate()
+        manager.shutdown()
+    results.sort(key=lambda result: -result["accuracy"])
+    write_results(results, out)
+    return results
+
+
+def write_results(results, out):
+    with open(os.path.join(out, "results.json"), "w") as json_file:
+        json.dump(results, json_file, indent=1)
+    with open(os.path.join(out, "results.csv"), "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=COLUMNS)
+        writer.writeheader()
+        for result in results:
+            row = dict(result)
+            row["params"] = json.dumps(result["params"], sort_keys=True)
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Hyperparameter sweep of SpeechActModel")
+    parser.add_argument("space", nargs="?",
+                        help="json file with parameter -> list of values, "
+                             "the models of the_big_test without")
+    parser.add_argument("-n", "--random", type=int,
+                        help="number of random trials instead of the grid")
+    parser.add_argument("-r", "--repeats", type=int, default=1)
+    parser.add_argument("-p", "--processes", type=int)
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="CPU threads per trial")
+    parser.add_argument("--no-early-stopping", action="store_true")
+    parser.add_argument("-o", "--out", default="sweeps")
+    args = parser.parse_args()
+
+    if args.space:
+        with open(args.space) as json_file:
+            space = json.load(json_file)
+        if args.random:
+            trials = random_search(space, args.random)
+        else:
+            trials = grid(space)
+    else:
+        trials = BIG_TEST
+    run_sweep(trials, args.repeats, args.processes, args.threads,
+              not args.no_early_stopping, out=args.out)
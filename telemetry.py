@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import platform
+import time
+from collections import OrderedDict
+from keras.callbacks import Callback
+from utils import percentile, rss_mib
+
+
+class TelemetryRecorder(Callback):
+    """
+    Keras callback that appends what happens while training to a
+    JSON-lines file: one record when training starts and ends, one per
+    epoch and, with batches=True, one per batch
+    param samples: training samples per epoch, for the samples/s
+    """
+
+    def __init__(self, filename="telemetry.jsonl", samples=None,
+                 batches=True, run=None, info=None):
+        super().__init__()
+        self.filename = filename
+        self.samples = samples
+        self.batches = batches
+        self.run = run or "{}-{}".format(time.strftime("%Y%m%d-%H%M%S"),
+                                         os.getpid())
+        self.info = info or {}
+
+    def write(self, event, **record):
+        record = OrderedDict([("run", self.run), ("event", event),
+                              ("time", time.time())] +
+                             list(record.items()))
+        with open(self.filename, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def metrics(logs):
+        return dict((key, float(value)) for key, value in (logs or {}).items())
+
+    def on_train_begin(self, logs=None):
+        self.train_start = time.perf_counter()
+        self.write("train_begin", host=platform.node(),
+                   machine=platform.platform(), cpus=os.cpu_count(),
+                   samples=self.samples,
+                   epochs=self.params.get("epochs"),
+                   steps=self.params.get("steps"), info=self.info,
+                   **rss_mib())
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.epoch_start = time.perf_counter()
+        self.batch_seconds = 0.0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.batch_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        seconds = time.perf_counter() - self.batch_start
+        self.batch_seconds += seconds
+        if not self.batches:
+            return
+        record = {"epoch": self.epoch, "batch": batch, "seconds": seconds}
+        steps = self.params.get("steps")
+        if self.samples and steps:
+            # the mean batch size, the batches of a bucket differ
+            record["samples_per_second"] = self.samples / steps / seconds
+        record.update(self.metrics(logs))
+        self.write("batch", **record)
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self.epoch_start
+        record = {"epoch": epoch, "seconds": seconds,
+                  "batch_seconds": self.batch_seconds}
+        if self.samples:
+            record["samples_per_second"] = self.samples / seconds
+        record.update(self.metrics(logs))
+        record.update(rss_mib())
+        self.write("epoch", **record)
+
+    def on_train_end(self, logs=None):
+        self.write("train_end",
+                   seconds=time.perf_counter() - self.train_start,
+                   **rss_mib())
+
+
+def read_telemetry(filename):
+    """The records of a telemetry file, grouped by run"""
+    runs = OrderedDict()
+    with open(filename) as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                runs.setdefault(record["run"], []).append(record)
+    return runs
+
+
+def summarise(records):
+    """Where the training time of one run went"""
+    begin = next((r for r in records if r["event"] == "train_begin"), {})
+    end = next((r for r in records if r["event"] == "train_end"), {})
+    epochs = [r for r in records if r["event"] == "epoch"]
+    batches = [r["seconds"] for r in records if r["event"] == "batch"]
+    summary = OrderedDict([("host", begin.get("host")),
+                           ("cpus", begin.get("cpus")),
+                           ("info", begin.get("info")),
+                           ("epochs", len(epochs)),
+                           ("seconds", end.get("seconds"))])
+    if epochs:
+        epoch_seconds = [r["seconds"] for r in epochs]
+        batch_seconds = sum(r["batch_seconds"] for r in epochs)
+        summary["epoch_mean"] = sum(epoch_seconds) / len(epoch_seconds)
+        summary["first_epoch"] = epoch_seconds[0]
+        # what is not in the batches: validation and the epoch overhead
+        summary["batch_share"] = batch_seconds / sum(epoch_seconds)
+        if "samples_per_second" in epochs[-1]:
+            summary["samples_per_second"] = sum(
+                r["samples_per_second"] for r in epochs) / len(epochs)
+        for key in ["loss", "accuracy", "val_loss", "val_accuracy"]:
+            if key in epochs[-1]:
+                summary[key] = epochs[-1][key]
+    if batches:
+        summary["batch_p50"] = percentile(batches, 50)
+        summary["batch_p95"] = percentile(batches, 95)
+        summary["batch_p99"] = percentile(batches, 99)
+    summary["peak_mib"] = max(r.get("peak_mib") or 0 for r in records)
+    return summary
+
+
+def print_summary(run, summary):
+    print("{} on {} ({} cpus)".format(run, summary["host"], summary["cpus"]))
+    if summary.get("epochs"):
+        print("   {} epochs in {:.1f} s, {:.2f} s per epoch, first "
+              "{:.2f} s, {:.0f}% in batches".format(
+                  summary["epochs"], summary["seconds"] or 0,
+                  summary["epoch_mean"], summary["first_epoch"],
+                  summary["batch_share"] * 100))
+    if "samples_per_second" in summary:
+        print("   {:.0f} samples/s".format(summary["samples_per_second"]))
+    if "batch_p50" in summary:
+        print("   batch p50 {:.2f} ms, p95 {:.2f} ms, p99 {:.2f} ms".format(
+            summary["batch_p50"] * 1000, summary["batch_p95"] * 1000,
+            summary["batch_p99"] * 1000))
+    metrics = ["{} {:.4f}".format(key, summary[key]) for key in
+               ["loss", "accuracy", "val_loss", "val_accuracy"]
+               if key in summary]
+    if metrics:
+        print("   " + ", ".join(metrics))
+    print("   peak memory {:.0f} MiB".format(summary["peak_mib"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarise the training telemetry of SpeechActModel")
+    parser.add_argument("input", nargs="?", default="telemetry.jsonl")
+    parser.add_argument("-o", "--output", help="json file to write")
+    args = parser.parse_args()
+
+    report = OrderedDict((run, summarise(records)) for run, records
+                         in read_telemetry(args.input).items())
+    for run, summary in report.items():
+        print_summary(run, summary)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
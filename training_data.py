@@ -0,0 +1,106 @@
+import numpy as np
+from keras.utils import Sequence
+
+
+def deduplicate(xt, yt, max_count=4):
+    """
+    Collapse the identical (sentence, speechact) rows of the tokenized data
+    A row stands for at most max_count of them, frequent sentences keep
+    ceil(count / max_count) rows, else they would be seen once per epoch
+    with a huge weight
+    returns the rows and how many sentences each row stands for
+    """
+    xt = np.asarray(xt)
+    yt = np.asarray(yt)
+    rows = np.hstack([xt, np.argmax(yt, axis=1)[:, np.newaxis]])
+    _, first, counts = np.unique(rows, axis=0, return_index=True,
+                                 return_counts=True)
+    # keep the order of the data
+    order = np.argsort(first)
+    first = first[order]
+    counts = counts[order]
+    if max_count:
+        repeats = -(-counts // max_count)
+        first = np.repeat(first, repeats)
+        counts = np.repeat(counts / repeats, repeats)
+    return xt[first], yt[first], counts
+
+
+def sentence_lengths(xt):
+    """Number of tokens of the (pre-)padded sentences"""
+    return np.count_nonzero(np.asarray(xt), axis=1)
+
+
+class BucketedSequence(Sequence):
+    """
+    Batches of sentences of about the same length for model.fit
+    Every batch holds sentences of one length bucket, padded to the
+    longest length of that bucket instead of to sentence_size
+    Yields (x, y, sample_weight), weights are the duplicate counts
+    scaled to a mean of 1
+    """
+
+    def __init__(self, xt, yt, counts=None, batch_size=32, buckets=(4, 8),
+                 shuffle=True, seed=None):
+        self.xt = np.asarray(xt)
+        self.yt = np.asarray(yt)
+        if counts is None:
+            counts = np.ones(len(self.xt))
+        self.weights = np.asarray(counts, dtype=np.float32)
+        self.weights *= len(self.weights) / self.weights.sum()
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        lengths = np.maximum(sentence_lengths(self.xt), 1)
+        bounds = sorted(set(bound for bound in buckets
+                            if bound < self.xt.shape[1]))
+        bounds.append(self.xt.shape[1])
+        # (padded length, indices) of every bucket that is not empty
+        self.buckets = []
+        lower = 0
+        for bound in bounds:
+            indices = np.flatnonzero((lengths > lower) & (lengths <= bound))
+            if len(indices):
+                self.buckets.append((bound, indices))
+            lower = bound
+        self.on_epoch_end()
+
+    def on_epoch_end(self):
+        """Shuffle the sentences of the buckets and the order of batches"""
+        self.batches = []
+        for length, indices in self.buckets:
+            if self.shuffle:
+                indices = self.rng.permutation(indices)
+            for i in range(0, len(indices), self.batch_size):
+                self.batches.append((length, indices[i:i + self.batch_size]))
+        if self.shuffle:
+            self.rng.shuffle(self.batches)
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __getitem__(self, index):
+        length, indices = self.batches[index]
+        # the sentences are pre-padded, their tokens are at the end
+        x = self.xt[indices, -length:]
+        return x, self.yt[indices], self.weights[indices]
+
+
+def bucketed_split(xt, yt, v_split=0.1, batch_size=32, buckets=(4, 8),
+                   seed=None):
+    """
+    Split off the last v_split of the data for validation, like the
+    validation_split of model.fit, and deduplicate both parts
+    returns the training and the validation BucketedSequence
+    """
+    n_train = len(xt) - int(len(xt) * v_split)
+    training = BucketedSequence(*deduplicate(xt[:n_train], yt[:n_train]),
+                                batch_size=batch_size, buckets=buckets,
+                                seed=seed)
+    validation = None
+    if n_train < len(xt):
+        validation = BucketedSequence(*deduplicate(xt[n_train:],
+                                                   yt[n_train:]),
+                                      batch_size=batch_size, buckets=buckets,
+                                      shuffle=False)
+    return training, validation
@@ -0,0 +1,32 @@
+import argparse
+from text_classification import SpeechActModel
+
+
+def read_lines(filename):
+    """Non-empty lines of "speechact sentence" of a file"""
+    with open(filename) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fine-tune the saved speech act model on new "
+                    "labelled utterances")
+    parser.add_argument("input", nargs="+",
+                        help="files with lines of 'speechact sentence'")
+    parser.add_argument("-p", "--path", default="model",
+                        help="model artifact to update")
+    parser.add_argument("-o", "--out",
+                        help="directory to save to, default is --path")
+    parser.add_argument("-e", "--epochs", type=int, default=2)
+    parser.add_argument("-r", "--replay", type=int, default=2000,
+                        help="old training lines trained along")
+    parser.add_argument("-s", "--seed", type=int)
+    args = parser.parse_args()
+
+    lines = []
+    for filename in args.input:
+        lines += read_lines(filename)
+    sam = SpeechActModel(retrain=False, path=args.path)
+    sam.update_model(lines, args.epochs, args.replay, args.seed)
+    sam.save_model(sam.model, args.out or args.path)
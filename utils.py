@@ -1,4 +1,8 @@
+import hashlib
+import math
+import os
 import string
+from collections import OrderedDict
 from Levenshtein import ratio
 
 
@@ -65,6 +69,219 @@ def closest_word(word, lexicon, treshold=0.8):
         return ""
 
 
+def indel_distance(word1, word2):
+    """
+    Insertions and deletions needed to turn word1 into word2,
+    the edit distance behind Levenshtein.ratio
+    """
+    lensum = len(word1) + len(word2)
+    return int(round((1 - ratio(word1, word2)) * lensum))
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over a lexicon,
+    finds all words within a distance without comparing to every word
+    """
+
+    def __init__(self, words=(), distance=indel_distance):
+        self.distance = distance
+        # a node is [word, {distance: child node}]
+        self.root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if self.root is None:
+            self.root = [word, {}]
+            return
+        node = self.root
+        while True:
+            dist = self.distance(word, node[0])
+            if dist == 0:
+                return
+            if dist not in node[1]:
+                node[1][dist] = [word, {}]
+                return
+            node = node[1][dist]
+
+    def search(self, word, radius):
+        """Returns all (distance, word) within radius of word"""
+        found = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            dist = self.distance(word, node[0])
+            if dist <= radius:
+                found.append((dist, node[0]))
+            for child_dist, child in node[1].items():
+                if dist - radius <= child_dist <= dist + radius:
+                    nodes.append(child)
+        return found
+
+
+class DeleteIndex:
+    """
+    Symmetric delete spelling index over a lexicon
+    Gives the same result as closest_word, but only compares the word to
+    lexicon words that share a deletion variant with it
+    Words are indexed with at most max_depth deletions, words that could
+    need more are compared to the lexicon words of a fitting length
+    """
+
+    def __init__(self, lexicon, treshold=0.8, max_depth=2):
+        self.treshold = treshold
+        self.max_depth = max_depth
+        self.lexicon = list(lexicon)
+        self.order = {}
+        # deletion variant -> indices of the lexicon words
+        self.index = {}
+        # length -> indices of the lexicon words
+        self.lengths = {}
+        for i, word in enumerate(self.lexicon):
+            word = str(word)
+            if word in self.order:
+                continue
+            self.order[word] = i
+            self.lengths.setdefault(len(word), []).append(i)
+            for variant in self.deletes(word):
+                self.index.setdefault(variant, []).append(i)
+        self.longest = max(self.lengths) if self.lengths else 0
+
+    def max_deletes(self, length):
+        """
+        A ratio above treshold leaves at most this many characters
+        out of the longest common subsequence
+        """
+        bound = length * (2 - 2 * self.treshold) / (2 - self.treshold)
+        return max(int(math.ceil(bound + 1e-9)) - 1, 0)
+
+    def max_length(self, length):
+        """Longest word that can have a ratio above treshold with length"""
+        return int(length * (2 - self.treshold) / self.treshold + 1e-9)
+
+    def deletes(self, word):
+        """All variants of word with up to max_deletes characters removed"""
+        variants = {word}
+        frontier = {word}
+        for _ in range(min(self.max_deletes(len(word)), self.max_depth)):
+            frontier = {variant[:i] + variant[i + 1:]
+                        for variant in frontier
+                        for i in range(len(variant))}
+            variants |= frontier
+        return variants
+
+    def closest(self, word):
+        if word in self.order:
+            return self.lexicon[self.order[word]]
+        if len(word) > self.max_length(self.longest):
+            # too long for a ratio above treshold with any lexicon word
+            return ""
+        if self.max_deletes(self.max_length(len(word))) <= self.max_depth:
+            candidates = set()
+            for variant in self.deletes(word):
+                candidates.update(self.index.get(variant, ()))
+        else:
+            # a match could need more deletions than were indexed
+            shortest = len(word) - self.max_deletes(len(word))
+            candidates = [i for length in
+                          range(shortest, self.max_length(len(word)) + 1)
+                          for i in self.lengths.get(length, ())]
+        treshold = self.treshold
+        best_match = ""
+        for i in sorted(candidates):
+            dist = ratio(word, str(self.lexicon[i]))
+            if dist > treshold:
+                treshold = dist
+                best_match = self.lexicon[i]
+        return best_match
+
+
+class LRUCache:
+    """
+    Dictionary of bounded size that drops the least recently used item,
+    counts hits, misses and evictions
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        if key in self.items:
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.items.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "items": len(self.items),
+                "size": self.size}
+
+
+def file_hash(filenames):
+    """Hash of the contents of the files"""
+    sha = hashlib.sha1()
+    for filename in filenames:
+        with open(filename, "rb") as file:
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def rss_mib():
+    """
+    Current and peak resident memory of the process,
+    None where the platform does not tell
+    """
+    try:
+        # only on POSIX
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        peak = None
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        current = pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        current = None
+    return {"current_mib": current, "peak_mib": peak}
+
+
+def percentile(values, p):
+    """Nearest rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = math.ceil(p / 100 * len(values)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
 def dbprint(s):
     if debug:
         print("  {}! debug: {}{}".format(c.r, s, c.E))
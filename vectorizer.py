@@ -0,0 +1,67 @@
+import numpy as np
+
+
+# the default filters of the Keras Tokenizer
+FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+
+class Vectorizer:
+    """
+    Turns sentences into padded arrays of word ids at inference
+    Gives the same as tokenizer.texts_to_sequences followed by
+    pad_sequences(maxlen=sentence_size, dtype='int32') with the default
+    pre-padding and pre-truncating, without Keras
+    """
+
+    def __init__(self, word_index, sentence_size, oov_token=None,
+                 filters=FILTERS, lower=True, split=" "):
+        self.word_index = dict(word_index)
+        self.sentence_size = sentence_size
+        self.oov = self.word_index.get(oov_token) \
+            if oov_token is not None else None
+        self.skip_oov = oov_token is None
+        self.table = str.maketrans(dict((c, split) for c in filters))
+        self.lower = lower
+        self.split = split
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, sentence_size):
+        """Vectorizer with the vocabulary and settings of a Tokenizer"""
+        return cls(tokenizer.word_index, sentence_size,
+                   oov_token=tokenizer.oov_token, filters=tokenizer.filters,
+                   lower=tokenizer.lower, split=tokenizer.split)
+
+    def ids(self, sentence):
+        """Word ids of a sentence, like texts_to_sequences"""
+        if self.lower:
+            sentence = sentence.lower()
+        words = sentence.translate(self.table).split(self.split)
+        get = self.word_index.get
+        if self.skip_oov:
+            ids = [get(word) for word in words if word]
+            return [i for i in ids if i is not None]
+        oov = self.oov
+        return [get(word, oov) for word in words if word]
+
+    def pad(self, sequences, out=None):
+        """
+        Padded array of lists of word ids, like pad_sequences
+        param out: int32 array of at least len(sequences) rows to write
+                   into instead of a new array, returns a view of it
+        """
+        n = len(sequences)
+        if out is None:
+            out = np.zeros((n, self.sentence_size), dtype=np.int32)
+        else:
+            out = out[:n]
+            out.fill(0)
+        size = self.sentence_size
+        for row, sequence in zip(out, sequences):
+            sequence = sequence[-size:]
+            if sequence:
+                row[size - len(sequence):] = sequence
+        return out
+
+    def transform(self, sentences):
+        """Padded array of the word ids of sentences"""
+        return self.pad([self.ids(sentence) for sentence in sentences])